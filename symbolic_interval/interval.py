@@ -12,6 +12,14 @@ from __future__ import print_function
 import numpy as np
 import torch
 import warnings
+from collections import namedtuple
+
+
+'''Error dependency introduced by the overestimated nodes of one ReLU
+layer. Each error row only has one nonzero entry `val` at column `col`,
+so it is kept sparse until the next affine layer mixes the columns.
+'''
+Sparse_edep = namedtuple("Sparse_edep", ["col", "val"])
 
 
 class Interval():
@@ -128,8 +136,8 @@ class Inverse_interval(Interval):
 		
 		Interval.__init__(self, lower, upper)
 		self.use_cuda = use_cuda
-		self.shape = list(self.c.shape[1:])
-		self.n = list(self.c[0].reshape(-1).size())[0]
+		self.shape = self.c.shape[1:]
+		self.n = self.shape.numel()
 		self.input_size = self.n
 		self.batch_size = self.c.shape[0]
 
@@ -172,19 +180,28 @@ class Symbolic_interval(Interval):
 
 	* :attr:`n` is the number of hidden nodes in each layer.
 
-	* :attr:`idep` keeps the input dependencies.
+	* :attr:`idep` keeps the input dependencies. With `dtype` set to
+	  a lower precision such as torch.bfloat16, idep is stored and
+	  propagated in that precision while the center and the concretized
+	  bounds stay in full precision. This halves the memory traffic of
+	  the dominant matmuls but the rounding is not directed, so the
+	  bounds are no longer guaranteed to be sound. Only use it for
+	  training, not for verification.
 
 	* :attr:`edep` keeps the error dependency introduced by each
 	  overestimated nodes.
+
+	* :attr:`edep_ind` keeps the sample index of each error row.
 	'''
-	def __init__(self, lower, upper, epsilon=0, norm="linf", use_cuda=False):
+	def __init__(self, lower, upper, epsilon=0, norm="linf", use_cuda=False,\
+				dtype=None):
 		assert lower.shape[0]==upper.shape[0], "each symbolic"+\
 					"should have the same shape"
 		
 		Interval.__init__(self, lower, upper)
 		self.use_cuda = use_cuda
-		self.shape = list(self.c.shape[1:])
-		self.n = list(self.c[0].reshape(-1).size())[0]
+		self.shape = self.c.shape[1:]
+		self.n = self.shape.numel()
 		self.input_size = self.n
 		self.batch_size = self.c.shape[0]
 		self.epsilon = epsilon
@@ -194,6 +211,8 @@ class Symbolic_interval(Interval):
 					self.c.get_device()).unsqueeze(0)
 		else:
 			self.idep = torch.eye(self.n).unsqueeze(0)
+		if dtype is not None:
+			self.idep = self.idep.to(dtype)
 		self.edep = []
 		self.edep_ind = []
 		
@@ -215,17 +234,17 @@ class Symbolic_interval(Interval):
 			#  			.sum(dim=1, keepdim=False).sqrt()
 			idep = torch.norm(self.idep, dim=1, keepdim=False)
 
-			e = idep*self.epsilon
+			# bounds stay in full precision with a low precision idep
+			e = idep.type_as(self.c)*self.epsilon
 
 		elif self.norm == "l1":
 			idep = self.idep.abs().max(dim=1, keepdim=False)[0]
 
-			e = idep*self.epsilon
+			e = idep.type_as(self.c)*self.epsilon
 
 		if self.edep:
 			#print("sym e1", e)
-			for i in range(len(self.edep)):
-				e = e + self.edep_ind[i].t().mm(self.edep[i].abs())
+			e = self.edep_error(e)
 			#print("sym e2", e)
 
 		self.l = self.c - e
@@ -234,6 +253,31 @@ class Symbolic_interval(Interval):
 		return self
 
 
+	'''Add the concretized error dependencies to the error range `e`.
+	Sparse error rows are accumulated directly at their positions.
+	'''
+	def edep_error(self, e):
+		for i in range(len(self.edep)):
+			edep = self.edep[i]
+			if isinstance(edep, Sparse_edep):
+				e = e.index_put((self.edep_ind[i], edep.col),\
+						edep.val.abs(), accumulate=True)
+			else:
+				e = e.index_add(0, self.edep_ind[i], edep.abs())
+		return e
+
+
+	'''Materialize the sparse error dependencies as dense error rows.
+	'''
+	def densify(self):
+		for i in range(len(self.edep)):
+			edep = self.edep[i]
+			if isinstance(edep, Sparse_edep):
+				self.edep[i] = edep.val.new_zeros((edep.val.size(0),\
+						self.n)).scatter(1, edep.col[:, None],\
+						edep.val[:, None])
+
+
 	'''Extending convolutional layer nodes to a two-dimensional vector.
 	'''
 	def extend(self):
@@ -241,18 +285,20 @@ class Symbolic_interval(Interval):
 		self.idep = self.idep.reshape(-1, self.input_size, self.n)
 
 		for i in range(len(self.edep)):
-			self.edep[i] = self.edep[i].reshape(-1, self.n)
+			if not isinstance(self.edep[i], Sparse_edep):
+				self.edep[i] = self.edep[i].reshape(-1, self.n)
 
 
 	'''Convert the extended layer back to the shape stored in `shape`.
 	'''
 	def shrink(self):
-		self.c = self.c.reshape(tuple([-1]+self.shape))
-		self.idep = self.idep.reshape(tuple([-1]+self.shape))
+		self.c = self.c.reshape((-1,)+self.shape)
+		self.idep = self.idep.reshape((-1,)+self.shape)
 
+		self.densify()
 		for i in range(len(self.edep)):
 			self.edep[i] = self.edep[i].reshape(\
-				tuple([-1]+self.shape))
+				(-1,)+self.shape)
 
 
 	'''Calculate the wrost case of the analyzed output ranges.
@@ -280,10 +326,10 @@ class Symbolic_interval(Interval):
 					view(self.batch_size, self.input_size,1)
 		self.idep = self.idep-idep_t
 
+		self.densify()
 		for i in range(len(self.edep)):
-			edep_t = self.edep[i].masked_select((self.edep_ind[i].\
-						mm(kk.type_as(self.edep_ind[i]))).type_as(kk)).\
-						view(-1,1)
+			edep_t = self.edep[i].masked_select(\
+						kk.index_select(0, self.edep_ind[i])).view(-1,1)
 			self.edep[i] = self.edep[i]-edep_t
 
 		self.concretize()
@@ -299,8 +345,8 @@ class mix_interval(Symbolic_interval):
 		
 		Symbolic_interval.__init__(self, lower, upper)
 		self.use_cuda = use_cuda
-		self.shape = list(self.c.shape[1:])
-		self.n = list(self.c[0].reshape(-1).size())[0]
+		self.shape = self.c.shape[1:]
+		self.n = self.shape.numel()
 		self.input_size = self.n
 		self.batch_size = self.c.shape[0]
 		self.epsilon = epsilon
@@ -344,8 +390,7 @@ class mix_interval(Symbolic_interval):
 
 		if self.edep:
 			#print("sym e1", e)
-			for i in range(len(self.edep)):
-				e = e + self.edep_ind[i].t().mm(self.edep[i].abs())
+			e = self.edep_error(e)
 			#print("sym e2", e)
 
 		self.l = self.c - e
@@ -375,17 +420,17 @@ class mix_interval(Symbolic_interval):
 	'''Convert the extended layer back to the shape stored in `shape`.
 	'''
 	def shrink(self):
-		self.c = self.c.reshape(tuple([-1]+self.shape))
-		self.idep = self.idep.reshape(tuple([-1]+self.shape))
+		self.c = self.c.reshape((-1,)+self.shape)
+		self.idep = self.idep.reshape((-1,)+self.shape)
 
 		for i in range(len(self.edep)):
 			self.edep[i] = self.edep[i].reshape(\
-				tuple([-1]+self.shape))
+				(-1,)+self.shape)
 
-		self.nc = self.nc.reshape(tuple([-1]+self.shape))
-		self.ne = self.ne.reshape(tuple([-1]+self.shape))
-		self.nl = self.nl.reshape(tuple([-1]+self.shape))
-		self.nu = self.nu.reshape(tuple([-1]+self.shape))
+		self.nc = self.nc.reshape((-1,)+self.shape)
+		self.ne = self.ne.reshape((-1,)+self.shape)
+		self.nl = self.nl.reshape((-1,)+self.shape)
+		self.nu = self.nu.reshape((-1,)+self.shape)
 
 	'''Calculate the wrost case of the analyzed output ranges.
 	Return the upper bound of other output dependency minus target's
@@ -413,9 +458,8 @@ class mix_interval(Symbolic_interval):
 		self.idep = self.idep-idep_t
 
 		for i in range(len(self.edep)):
-			edep_t = self.edep[i].masked_select((self.edep_ind[i].\
-						mm(kk.type_as(self.edep_ind[i]))).type_as(kk)).\
-						view(-1,1)
+			edep_t = self.edep[i].masked_select(\
+						kk.index_select(0, self.edep_ind[i])).view(-1,1)
 			self.edep[i] = self.edep[i]-edep_t
 
 		self.concretize()
@@ -432,8 +476,8 @@ class Center_symbolic_interval(Interval):
 		
 		Interval.__init__(self, lower, upper)
 		self.use_cuda = use_cuda
-		self.shape = list(self.c.shape[1:])
-		self.n = list(self.c[0].reshape(-1).size())[0]
+		self.shape = self.c.shape[1:]
+		self.n = self.shape.numel()
 		self.input_size = self.n
 		self.batch_size = self.c.shape[0]
 		if(self.use_cuda):
@@ -468,8 +512,8 @@ class Center_symbolic_interval(Interval):
 	'''Convert the extended layer back to the shape stored in `shape`.
 	'''
 	def shrink(self):
-		self.c = self.c.reshape(tuple([-1]+self.shape))
-		self.idep = self.idep.reshape(tuple([-1]+self.shape))
+		self.c = self.c.reshape((-1,)+self.shape)
+		self.idep = self.idep.reshape((-1,)+self.shape)
 
 
 	'''Calculate the wrost case of the analyzed output ranges.
@@ -520,8 +564,8 @@ class Symbolic_interval_proj1(Interval):
 		
 		Interval.__init__(self, lower, upper)
 		self.use_cuda = use_cuda
-		self.shape = list(self.c.shape[1:])
-		self.n = list(self.c[0].reshape(-1).size())[0]
+		self.shape = self.c.shape[1:]
+		self.n = self.shape.numel()
 		self.input_size = self.n
 		self.batch_size = self.c.shape[0]
 		if(self.use_cuda):
@@ -582,7 +626,7 @@ class Symbolic_interval_proj1(Interval):
 		#print("e2", e)
 		if(self.edep):
 			for i in range(len(self.edep)):
-				e = e + self.edep_ind[i].t().mm(self.edep[i].abs())
+				e = e.index_add(0, self.edep_ind[i], self.edep[i].abs())
 		#print("e3", e)
 
 		self.l = self.c - e
@@ -605,13 +649,13 @@ class Symbolic_interval_proj1(Interval):
 	'''Convert the extended layer back to the shape stored in `shape`.
 	'''
 	def shrink(self):
-		self.c = self.c.reshape(tuple([-1]+self.shape))
-		self.idep = self.idep.reshape(tuple([-1]+self.shape))
-		self.idep_proj = self.idep_proj.view(tuple([self.batch_size]+self.shape))
+		self.c = self.c.reshape((-1,)+self.shape)
+		self.idep = self.idep.reshape((-1,)+self.shape)
+		self.idep_proj = self.idep_proj.view((self.batch_size,)+self.shape)
 
 		for i in range(len(self.edep)):
 			self.edep[i] = self.edep[i].reshape(\
-				tuple([-1]+self.shape))
+				(-1,)+self.shape)
 
 
 	'''Calculate the wrost case of the analyzed output ranges.
@@ -644,9 +688,8 @@ class Symbolic_interval_proj1(Interval):
 		self.idep_proj = self.idep_proj*(1-kk).type_as(self.idep_proj)
 
 		for i in range(len(self.edep)):
-			edep_t = self.edep[i].masked_select((self.edep_ind[i].\
-						mm(kk.type_as(self.edep_ind[i]))).type_as(kk)).\
-						view(-1,1)
+			edep_t = self.edep[i].masked_select(\
+						kk.index_select(0, self.edep_ind[i])).view(-1,1)
 			self.edep[i] = self.edep[i]-edep_t
 
 		self.concretize()
@@ -672,8 +715,8 @@ class Symbolic_interval_proj2(Interval):
 		
 		Interval.__init__(self, lower, upper)
 		self.use_cuda = use_cuda
-		self.shape = list(self.c.shape[1:])
-		self.n = list(self.c[0].reshape(-1).size())[0]
+		self.shape = self.c.shape[1:]
+		self.n = self.shape.numel()
 		self.input_size = self.n
 		self.batch_size = self.c.shape[0]
 		if(self.use_cuda):
@@ -753,10 +796,10 @@ class Symbolic_interval_proj2(Interval):
 	'''Convert the extended layer back to the shape stored in `shape`.
 	'''
 	def shrink(self):
-		self.c = self.c.reshape(tuple([-1]+self.shape))
-		self.idep = self.idep.reshape(tuple([-1]+self.shape))
-		self.idep_proj = self.idep_proj.view(tuple([self.batch_size]+self.shape))
-		self.edep = self.edep.view(tuple([-1]+self.shape))
+		self.c = self.c.reshape((-1,)+self.shape)
+		self.idep = self.idep.reshape((-1,)+self.shape)
+		self.idep_proj = self.idep_proj.view((self.batch_size,)+self.shape)
+		self.edep = self.edep.view((-1,)+self.shape)
 
 
 	'''Calculate the wrost case of the analyzed output ranges.
@@ -804,8 +847,8 @@ class gen_sym(Symbolic_interval):
 		
 		Symbolic_interval.__init__(self, lower, upper, epsilon, norm, use_cuda)
 		self.use_cuda = use_cuda
-		self.shape = list(self.c.shape[1:])
-		self.n = list(self.c[0].reshape(-1).size())[0]
+		self.shape = self.c.shape[1:]
+		self.n = self.shape.numel()
 		self.input_size = self.n
 		self.batch_size = self.c.shape[0]
 		self.epsilon = epsilon
@@ -845,8 +888,7 @@ class gen_sym(Symbolic_interval):
 
 		if self.edep:
 			#print("sym e1", e)
-			for i in range(len(self.edep)):
-				e = e + self.edep_ind[i].t().mm(self.edep[i].abs())
+			e = self.edep_error(e)
 			#print("sym e2", e)
 
 		self.l = self.c - e
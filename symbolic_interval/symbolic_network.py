@@ -16,6 +16,8 @@ for naive interval analysis:
 from __future__ import print_function
 
 import copy
+import warnings
+import weakref
 import numpy as np
 import torch
 import torch.nn as nn
@@ -28,47 +30,219 @@ from .interval import (
     mix_interval,
     Inverse_interval,
     Center_symbolic_interval,
+    Sparse_edep,
 )
 from .interval import Symbolic_interval_proj1, Symbolic_interval_proj2, gen_sym
 import time
 
 
+# Interval networks already built for each model, reused across batches.
+_inet_cache = weakref.WeakKeyDictionary()
+
+
+def _linear_sym(c, idep, edep, layer):
+    """Propagate the center, input dependencies and error dependencies of
+    a symbolic interval through a linear layer. The center and the dense
+    error rows share a single GEMM on their concatenated rows; idep, the
+    largest of them, gets its own GEMM so that it is never copied. The
+    bias is only added to the center. A sparse error row only selects one
+    column of the weight, so it is gathered instead of multiplied.
+    """
+    weight = layer.weight
+    rows = [c] + [e for e in edep if not isinstance(e, Sparse_edep)]
+    sizes = [r.shape[0] for r in rows]
+    out = F.linear(torch.cat(rows, dim=0), weight).split(sizes, dim=0)
+
+    c = out[0] if layer.bias is None else out[0] + layer.bias
+    # idep kept in a lower precision is multiplied in that precision
+    idep = F.linear(idep, weight.to(idep.dtype))
+    dense = iter(out[1:])
+    res = []
+    for e in edep:
+        if isinstance(e, Sparse_edep):
+            res.append(weight.t().index_select(0, e.col) * e.val.unsqueeze(1))
+        else:
+            res.append(next(dense))
+    return c, idep, res
+
+
+def _conv2d_edep(edep, layer):
+    """Propagate all error dependencies through a convolutional layer
+    with a single convolution over the concatenated error rows.
+    """
+    if not edep:
+        return edep
+    sizes = [e.shape[0] for e in edep]
+    out = F.conv2d(
+        torch.cat(edep, dim=0),
+        layer.weight,
+        stride=layer.stride,
+        padding=layer.padding,
+    )
+    return list(out.split(sizes, dim=0))
+
+
+def _scale_edep(edep, edep_ind, mask):
+    """Multiply each error row by the ReLU slopes of its own sample. All
+    of the error rows are handled by one gather and one multiplication.
+    """
+    if not edep:
+        return edep
+    sizes = [e.shape[0] for e in edep]
+    scale = mask.index_select(0, torch.cat(edep_ind, dim=0))
+    return list((torch.cat(edep, dim=0) * scale).split(sizes, dim=0))
+
+
+@torch.jit.script
+def _relu_relaxation(l: torch.Tensor, u: torch.Tensor):
+    """Symbolic linear relaxation of ReLU nodes with input range [l, u].
+    Returns the slope of each node, the mask of cross-0 nodes and the
+    error introduced by the relaxation, fused into a single kernel.
+    """
+    lower = l.clamp(max=0)
+    upper = torch.max(u.clamp(min=0), lower + 1e-8)
+    mask = upper / (upper - lower)
+    appr_condition = (l < 0) & (u > 0)
+    appr_err = mask * (-lower) / 2.0
+    return mask, appr_condition, appr_err
+
+
+@torch.jit.script
+def _sym_relu(c: torch.Tensor, l: torch.Tensor, u: torch.Tensor):
+    """Whole symbolic ReLU update of the center in one scripted function.
+    Returns the new center, the slopes, the (sample, node) index of each
+    cross-0 node and the error introduced at that node.
+    """
+    mask, appr_condition, appr_err = _relu_relaxation(l, u)
+    appr_ind = appr_condition.view(l.size(0), -1).nonzero()
+    appr_val = appr_err.masked_select(appr_condition)
+    c = c * mask + appr_err.masked_fill(~appr_condition, 0.0)
+    return c, mask, appr_ind, appr_val
+
+
+@torch.jit.script
+def _relu_mask(lower: torch.Tensor, upper: torch.Tensor):
+    """Relaxation used by the center and proj1 intervals: slope u/(u-l)
+    of the cross-0 nodes, 1 for the active ones and 0 otherwise, without
+    clamping the bounds. The gradient does not flow through the
+    denominator of the slope.
+    """
+    appr_condition = (lower < 0) & (upper > 0)
+    denom = (upper - lower).detach().clamp_min(1e-12)
+    mask = torch.where(appr_condition, upper / denom, (lower > 0).type_as(lower))
+    appr_err = mask * (-lower) / 2.0
+    return mask, appr_condition, appr_err
+
+
+def _interval_conv2d_eager(c, e, weight, weight_abs, bias, stride, padding):
+    """Naive interval propagation through a convolutional layer. Returns
+    the lower and upper bounds of the output.
+    """
+    c = F.conv2d(c, weight, bias=bias, stride=stride, padding=padding)
+    e = F.conv2d(e, weight_abs, stride=stride, padding=padding)
+    return c - e, c + e
+
+
+# Compiled on first use, see _interval_conv2d.
+_interval_conv2d_impl = None
+
+
+def _interval_conv2d(*args):
+    """_interval_conv2d_eager compiled with torch.compile, so that inductor
+    fuses the bound arithmetic into the convolution epilogues. It is only
+    compiled on first use and falls back to eager mode, with a warning,
+    when Dynamo is not available or the backend fails to compile it.
+    """
+    global _interval_conv2d_impl
+    if _interval_conv2d_impl is None:
+        _interval_conv2d_impl = _interval_conv2d_eager
+        try:
+            import torch._dynamo
+
+            supported = torch._dynamo.is_dynamo_supported()
+        except (ImportError, AttributeError):
+            supported = False
+        if supported:
+            _interval_conv2d_impl = torch.compile(_interval_conv2d_eager)
+        else:
+            warnings.warn(
+                "torch.compile is not supported here, "
+                "naive interval convolutions run in eager mode"
+            )
+
+    if _interval_conv2d_impl is _interval_conv2d_eager:
+        return _interval_conv2d_eager(*args)
+    try:
+        return _interval_conv2d_impl(*args)
+    except torch._dynamo.exc.BackendCompilerFailed as err:
+        # e.g. no working C++ toolchain for inductor
+        warnings.warn(
+            "compiling the naive interval convolution failed (%s), "
+            "falling back to eager mode" % err
+        )
+        _interval_conv2d_impl = _interval_conv2d_eager
+        return _interval_conv2d_eager(*args)
+
+
+@torch.jit.script
+def _interval_relu_mask(l: torch.Tensor, u: torch.Tensor):
+    """Slope u/(u-l) of the cross-0 ReLU nodes, 0 for the inactive nodes
+    and 1 for the active ones.
+    """
+    slope = u / (u - l + 0.000001)
+    return torch.where(
+        u <= 0,
+        torch.zeros_like(u),
+        torch.where(l >= 0, torch.ones_like(u), slope),
+    )
+
+
 class Interval_network(nn.Module):
     """Convert a nn.Sequential model to a network support symbolic
     interval propagations/naive interval propagations.
     """
 
-    def __init__(self, model, c):
+    def __init__(self, model, c=None):
         nn.Module.__init__(self)
         self.intermediate_ix = []
-        self.net_ = []
+        self.layers = list(model)
+        net = []
         first_layer = True
-        last_layer = False
 
         for layer in model:
-            if isinstance(layer, nn.Linear):
-                if layer == model[-1]:
-                    last_layer = True
-                if last_layer and c is not None:
-                    wc_matrix = c
+            entry = _interval_wrapper(layer)
+            if entry is not None:
+                wrapper, affine = entry
+                if affine:
+                    net.append(wrapper(layer, first_layer))
+                    first_layer = False
                 else:
-                    wc_matrix = None
-                self.net_.append(
-                    Interval_Dense(layer, first_layer, wc_matrix=wc_matrix)
-                )
-                first_layer = False
-            if isinstance(layer, nn.ReLU):
-                self.net_.append(Interval_ReLU(layer))
-            if isinstance(layer, nn.Conv2d):
-                self.net_.append(Interval_Conv2d(layer, first_layer))
-                first_layer = False
-            if "Flatten" in (str(layer.__class__.__name__)):
-                self.net_.append(Interval_Flatten())
-            if "Vlayer" in (str(layer.__class__.__name__)):
-                self.net_.append(Interval_Vlayer(layer))
-            if "bn" in (str(layer.__class__.__name__)):
-                self.net_.append(Interval_BN(layer))
-        self.net = nn.Sequential(*self.net_)
+                    net.append(wrapper(layer))
+            elif "Flatten" in (str(layer.__class__.__name__)):
+                net.append(Interval_Flatten())
+            elif "Vlayer" in (str(layer.__class__.__name__)):
+                net.append(Interval_Vlayer(layer))
+            elif "bn" in (str(layer.__class__.__name__)):
+                net.append(Interval_BN(layer))
+            else:
+                raise TypeError("Unsupported layer for interval analysis: %s" % layer)
+        self.net = nn.Sequential(*net)
+        self.set_wc_matrix(c)
+
+    def set_wc_matrix(self, c):
+        """Use `c` as the worst case matrix of the last layer if it is a
+        linear layer.
+        """
+        if isinstance(self.net[-1], Interval_Dense):
+            self.net[-1].wc_matrix = c
+
+    def wraps(self, model):
+        """Whether this interval network is built on the current layers
+        of `model`.
+        """
+        return len(self.layers) == len(model) and all(
+            a is b for a, b in zip(self.layers, model)
+        )
 
     """Forward intervals for each layer.
 
@@ -81,20 +255,52 @@ class Interval_network(nn.Module):
         if sequential:
             return self.net(ix)
         else:
-            for layer in self.net_:
+            self.intermediate_ix = []
+            for layer in self.net:
                 ix = layer(ix)
                 cix = copy.copy(ix)
                 cix = cix.concretize()
                 self.intermediate_ix += [cix]
             return ix
+
+
+class Weight_abs_cache(object):
+    """Cache of |W| for the interval layers wrapping a weighted `layer`.
+    The copy is built on first use without gradients, so wrappers that
+    only run under autograd never hold one.
+    """
+
+    _abs_weight = None
+    _weight_source = None
+    _weight_version = None
+
+    def weight_abs(self):
+        """|W| of the wrapped layer. The cached copy is refreshed whenever
+        the weight is updated in place, replaced (`weight.data = ...` or a
+        new Parameter), moved or cast, and is only used when no gradient
+        is needed.
         """
-		for i, layer in enumerate(self.net):
-			ix = layer(ix)
-		return ix
-		"""
+        weight = self.layer.weight
+        if torch.is_grad_enabled() and weight.requires_grad:
+            return weight.abs()
+        source = self._weight_source
+        if (
+            source is None
+            or source.data_ptr() != weight.data_ptr()
+            or source.shape != weight.shape
+            or source.device != weight.device
+            or source.dtype != weight.dtype
+            or weight._version != self._weight_version
+        ):
+            # Holding an alias of the source keeps its storage alive, so
+            # a replacement weight can never reuse its address.
+            self._weight_source = weight.detach()
+            self._abs_weight = self._weight_source.abs()
+            self._weight_version = weight._version
+        return self._abs_weight
 
 
-class Interval_Dense(nn.Module):
+class Interval_Dense(Weight_abs_cache, nn.Module):
     def __init__(self, layer, first_layer=False, wc_matrix=None):
         nn.Module.__init__(self)
         self.layer = layer
@@ -108,25 +314,22 @@ class Interval_Dense(nn.Module):
             # print (ix.c.shape, self.layer.weight.shape)
             ix.c = F.linear(c, self.layer.weight, bias=self.layer.bias)
             ix.idep = F.linear(idep, self.layer.weight)
-            ix.shape = list(ix.c.shape[1:])
-            ix.n = list(ix.c[0].view(-1).size())[0]
+            ix.shape = ix.c.shape[1:]
+            ix.n = ix.shape.numel()
             ix.concretize()
             return ix
 
         if isinstance(ix, mix_interval):
             # print (ix.c.shape, self.layer.weight.shape)
-            ix.c = F.linear(ix.c, self.layer.weight, bias=self.layer.bias)
-            ix.idep = F.linear(ix.idep, self.layer.weight)
-            for i in range(len(ix.edep)):
-                ix.edep[i] = F.linear(ix.edep[i], self.layer.weight)
-            ix.shape = list(ix.c.shape[1:])
-            ix.n = list(ix.c[0].view(-1).size())[0]
+            ix.c, ix.idep, ix.edep = _linear_sym(ix.c, ix.idep, ix.edep, self.layer)
+            ix.shape = ix.c.shape[1:]
+            ix.n = ix.shape.numel()
 
             c = ix.nc
             e = ix.ne
             if self.wc_matrix is None:
                 c = F.linear(c, self.layer.weight, bias=self.layer.bias)
-                e = F.linear(e, self.layer.weight.abs())
+                e = F.linear(e, self.weight_abs())
                 ix.nc, ix.ne, ix.nl, ix.nu = c, e, c - e, c + e
             else:
                 weight = self.wc_matrix.matmul(self.layer.weight)
@@ -145,12 +348,9 @@ class Interval_Dense(nn.Module):
 
         if isinstance(ix, Symbolic_interval):
             # print (ix.c.shape, self.layer.weight.shape)
-            ix.c = F.linear(ix.c, self.layer.weight, bias=self.layer.bias)
-            ix.idep = F.linear(ix.idep, self.layer.weight)
-            for i in range(len(ix.edep)):
-                ix.edep[i] = F.linear(ix.edep[i], self.layer.weight)
-            ix.shape = list(ix.c.shape[1:])
-            ix.n = list(ix.c[0].view(-1).size())[0]
+            ix.c, ix.idep, ix.edep = _linear_sym(ix.c, ix.idep, ix.edep, self.layer)
+            ix.shape = ix.c.shape[1:]
+            ix.n = ix.shape.numel()
             ix.concretize()
             return ix
 
@@ -159,14 +359,10 @@ class Interval_Dense(nn.Module):
             idep = ix.idep
             edep = ix.edep
 
-            ix.c = F.linear(c, self.layer.weight, bias=self.layer.bias)
-            ix.idep = F.linear(idep, self.layer.weight)
-            ix.idep_proj = F.linear(ix.idep_proj, self.layer.weight.abs())
-
-            for i in range(len(edep)):
-                ix.edep[i] = F.linear(edep[i], self.layer.weight)
-            ix.shape = list(ix.c.shape[1:])
-            ix.n = list(ix.c[0].view(-1).size())[0]
+            ix.c, ix.idep, ix.edep = _linear_sym(c, idep, edep, self.layer)
+            ix.idep_proj = F.linear(ix.idep_proj, self.weight_abs())
+            ix.shape = ix.c.shape[1:]
+            ix.n = ix.shape.numel()
             ix.concretize()
             return ix
 
@@ -177,12 +373,12 @@ class Interval_Dense(nn.Module):
 
             ix.c = F.linear(c, self.layer.weight, bias=self.layer.bias)
             ix.idep = F.linear(idep, self.layer.weight)
-            ix.idep_proj = F.linear(ix.idep_proj, self.layer.weight.abs())
+            ix.idep_proj = F.linear(ix.idep_proj, self.weight_abs())
 
-            ix.edep = F.linear(ix.edep, self.layer.weight.abs())
+            ix.edep = F.linear(ix.edep, self.weight_abs())
 
-            ix.shape = list(ix.c.shape[1:])
-            ix.n = list(ix.c[0].view(-1).size())[0]
+            ix.shape = ix.c.shape[1:]
+            ix.n = ix.shape.numel()
             ix.concretize()
             return ix
 
@@ -203,7 +399,7 @@ class Interval_Dense(nn.Module):
             e = ix.e
             if self.wc_matrix is None:
                 c = F.linear(c, self.layer.weight, bias=self.layer.bias)
-                e = F.linear(e, self.layer.weight.abs())
+                e = F.linear(e, self.weight_abs())
             else:
                 weight = self.wc_matrix.matmul(self.layer.weight)
                 bias = self.wc_matrix.matmul(self.layer.bias)
@@ -221,7 +417,7 @@ class Interval_Dense(nn.Module):
             return ix
 
 
-class Interval_Conv2d(nn.Module):
+class Interval_Conv2d(Weight_abs_cache, nn.Module):
     def __init__(self, layer, first_layer=False):
         nn.Module.__init__(self)
         self.layer = layer
@@ -247,8 +443,8 @@ class Interval_Conv2d(nn.Module):
                 padding=self.layer.padding,
             )
 
-            ix.shape = list(ix.c.shape[1:])
-            ix.n = list(ix.c[0].reshape(-1).size())[0]
+            ix.shape = ix.c.shape[1:]
+            ix.n = ix.shape.numel()
             ix.concretize()
             return ix
 
@@ -268,15 +464,9 @@ class Interval_Conv2d(nn.Module):
                 padding=self.layer.padding,
             )
 
-            for i in range(len(ix.edep)):
-                ix.edep[i] = F.conv2d(
-                    ix.edep[i],
-                    self.layer.weight,
-                    stride=self.layer.stride,
-                    padding=self.layer.padding,
-                )
-            ix.shape = list(ix.c.shape[1:])
-            ix.n = list(ix.c[0].reshape(-1).size())[0]
+            ix.edep = _conv2d_edep(ix.edep, self.layer)
+            ix.shape = ix.c.shape[1:]
+            ix.n = ix.shape.numel()
 
             c, e = ix.nc, ix.ne
 
@@ -289,7 +479,7 @@ class Interval_Conv2d(nn.Module):
             )
             e = F.conv2d(
                 e,
-                self.layer.weight.abs(),
+                self.weight_abs(),
                 stride=self.layer.stride,
                 padding=self.layer.padding,
             )
@@ -311,20 +501,14 @@ class Interval_Conv2d(nn.Module):
             )
             ix.idep = F.conv2d(
                 ix.idep,
-                self.layer.weight,
+                self.layer.weight.to(ix.idep.dtype),
                 stride=self.layer.stride,
                 padding=self.layer.padding,
             )
 
-            for i in range(len(ix.edep)):
-                ix.edep[i] = F.conv2d(
-                    ix.edep[i],
-                    self.layer.weight,
-                    stride=self.layer.stride,
-                    padding=self.layer.padding,
-                )
-            ix.shape = list(ix.c.shape[1:])
-            ix.n = list(ix.c[0].reshape(-1).size())[0]
+            ix.edep = _conv2d_edep(ix.edep, self.layer)
+            ix.shape = ix.c.shape[1:]
+            ix.n = ix.shape.numel()
             ix.concretize()
             return ix
 
@@ -349,20 +533,14 @@ class Interval_Conv2d(nn.Module):
             )
             ix.idep_proj = F.conv2d(
                 ix.idep_proj,
-                self.layer.weight.abs(),
+                self.weight_abs(),
                 stride=self.layer.stride,
                 padding=self.layer.padding,
             )
 
-            for i in range(len(edep)):
-                ix.edep[i] = F.conv2d(
-                    edep[i],
-                    self.layer.weight,
-                    stride=self.layer.stride,
-                    padding=self.layer.padding,
-                )
-            ix.shape = list(ix.c.shape[1:])
-            ix.n = list(ix.c[0].reshape(-1).size())[0]
+            ix.edep = _conv2d_edep(edep, self.layer)
+            ix.shape = ix.c.shape[1:]
+            ix.n = ix.shape.numel()
             ix.concretize()
             return ix
 
@@ -387,20 +565,20 @@ class Interval_Conv2d(nn.Module):
             )
             ix.idep_proj = F.conv2d(
                 ix.idep_proj,
-                self.layer.weight.abs(),
+                self.weight_abs(),
                 stride=self.layer.stride,
                 padding=self.layer.padding,
             )
 
             ix.edep = F.conv2d(
                 ix.edep,
-                self.layer.weight.abs(),
+                self.weight_abs(),
                 stride=self.layer.stride,
                 padding=self.layer.padding,
             )
 
-            ix.shape = list(ix.c.shape[1:])
-            ix.n = list(ix.c[0].reshape(-1).size())[0]
+            ix.shape = ix.c.shape[1:]
+            ix.n = ix.shape.numel()
             ix.concretize()
             return ix
 
@@ -425,22 +603,16 @@ class Interval_Conv2d(nn.Module):
             return ix
 
         if isinstance(ix, Interval):
-            c = ix.c
-            e = ix.e
-            c = F.conv2d(
-                c,
+            lower, upper = _interval_conv2d(
+                ix.c,
+                ix.e,
                 self.layer.weight,
-                stride=self.layer.stride,
-                padding=self.layer.padding,
-                bias=self.layer.bias,
+                self.weight_abs(),
+                self.layer.bias,
+                self.layer.stride,
+                self.layer.padding,
             )
-            e = F.conv2d(
-                e,
-                self.layer.weight.abs(),
-                stride=self.layer.stride,
-                padding=self.layer.padding,
-            )
-            ix.update_lu(c - e, c + e)
+            ix.update_lu(lower, upper)
 
             return ix
 
@@ -494,12 +666,7 @@ class Interval_ReLU(nn.Module):
             # print("sym u", upper)
             # print("sym l", lower)
 
-            appr_condition = ((lower < 0) * (upper > 0)).detach()
-            mask = (lower > 0).type_as(lower)
-            mask[appr_condition] = (
-                upper[appr_condition]
-                / (upper[appr_condition] - lower[appr_condition]).detach()
-            )
+            mask, _, _ = _relu_mask(lower, upper)
 
             new_mask = (ix.c >= 0).type_as(ix.c)
 
@@ -510,36 +677,29 @@ class Interval_ReLU(nn.Module):
 
         if isinstance(ix, mix_interval):
 
-            lower = ix.l.clamp(max=0)
-            upper = ix.u.clamp(min=0)
-            upper = torch.max(upper, lower + 1e-8)
-            mask = upper / (upper - lower)
-            appr_condition = (ix.l < 0) * (ix.u > 0)
-
-            m = int(appr_condition.sum().item())
+            mask, appr_condition, appr_err = _relu_relaxation(ix.l, ix.u)
 
             appr_ind = appr_condition.view(-1, ix.n).nonzero()
-
-            appr_err = mask * (-lower) / 2.0
+            m = appr_ind.size(0)
 
             if m != 0:
 
                 if ix.use_cuda:
-                    error_row = torch.zeros((m, ix.n), device=lower.get_device())
+                    error_row = torch.zeros((m, ix.n), device=mask.get_device())
                 else:
                     error_row = torch.zeros((m, ix.n))
 
                 error_row = error_row.scatter_(
-                    1, appr_ind[:, 1, None], appr_err[appr_condition][:, None]
+                    1,
+                    appr_ind[:, 1, None],
+                    appr_err.masked_select(appr_condition).unsqueeze(1),
                 )
 
-                edep_ind = lower.new(appr_ind.size(0), lower.size(0)).zero_()
-                edep_ind = edep_ind.scatter_(1, appr_ind[:, 0][:, None], 1)
+                edep_ind = appr_ind[:, 0]
 
-            ix.c = ix.c * mask + appr_err * appr_condition.type_as(lower)
+            ix.c = ix.c * mask + appr_err.masked_fill(~appr_condition, 0.0)
 
-            for i in range(len(ix.edep)):
-                ix.edep[i] = ix.edep[i] * ix.edep_ind[i].mm(mask)
+            ix.edep = _scale_edep(ix.edep, ix.edep_ind, mask)
 
             ix.idep = ix.idep * mask.view(ix.batch_size, 1, ix.n)
 
@@ -554,42 +714,23 @@ class Interval_ReLU(nn.Module):
 
         if isinstance(ix, Symbolic_interval):
 
-            lower = ix.l.clamp(max=0)
-            upper = ix.u.clamp(min=0)
-            upper = torch.max(upper, lower + 1e-8)
-            mask = upper / (upper - lower)
-            appr_condition = (ix.l < 0) * (ix.u > 0)
+            ix.c, mask, appr_ind, appr_val = _sym_relu(ix.c, ix.l, ix.u)
 
             # ix.l.retain_grad()
             # mask[0,0].backward()
             # print(ix.l.grad)
 
-            m = int(appr_condition.sum().item())
-
-            appr_ind = appr_condition.view(-1, ix.n).nonzero()
-
-            appr_err = mask * (-lower) / 2.0
+            m = appr_ind.size(0)
 
             if m != 0:
 
-                if ix.use_cuda:
-                    error_row = torch.zeros((m, ix.n), device=lower.get_device())
-                else:
-                    error_row = torch.zeros((m, ix.n))
+                error_row = Sparse_edep(appr_ind[:, 1], appr_val)
 
-                error_row = error_row.scatter_(
-                    1, appr_ind[:, 1, None], appr_err[appr_condition][:, None]
-                )
+                edep_ind = appr_ind[:, 0]
 
-                edep_ind = lower.new(appr_ind.size(0), lower.size(0)).zero_()
-                edep_ind = edep_ind.scatter_(1, appr_ind[:, 0][:, None], 1)
+            ix.edep = _scale_edep(ix.edep, ix.edep_ind, mask)
 
-            ix.c = ix.c * mask + appr_err * appr_condition.type_as(lower)
-
-            for i in range(len(ix.edep)):
-                ix.edep[i] = ix.edep[i] * ix.edep_ind[i].mm(mask)
-
-            ix.idep = ix.idep * mask.view(ix.batch_size, 1, ix.n)
+            ix.idep = ix.idep * mask.view(ix.batch_size, 1, ix.n).type_as(ix.idep)
 
             if m != 0:
 
@@ -603,17 +744,10 @@ class Interval_ReLU(nn.Module):
             # print("sym u", upper)
             # print("sym l", lower)
 
-            appr_condition = ((lower < 0) * (upper > 0)).detach()
-            mask = (lower > 0).type_as(lower)
-            mask[appr_condition] = (
-                upper[appr_condition]
-                / (upper[appr_condition] - lower[appr_condition]).detach()
-            )
+            mask, appr_condition, appr_err = _relu_mask(lower, upper)
 
-            m = int(appr_condition.sum().item())
             appr_ind = appr_condition.view(-1, ix.n).nonzero()
-
-            appr_err = mask * (-lower) / 2.0
+            m = appr_ind.size(0)
 
             if m != 0:
 
@@ -623,16 +757,16 @@ class Interval_ReLU(nn.Module):
                     error_row = torch.zeros((m, ix.n))
 
                 error_row = error_row.scatter_(
-                    1, appr_ind[:, 1, None], appr_err[appr_condition][:, None]
+                    1,
+                    appr_ind[:, 1, None],
+                    appr_err.masked_select(appr_condition).unsqueeze(1),
                 )
 
-                edep_ind = lower.new(appr_ind.size(0), lower.size(0)).zero_()
-                edep_ind = edep_ind.scatter_(1, appr_ind[:, 0][:, None], 1)
+                edep_ind = appr_ind[:, 0]
 
-            ix.c = ix.c * mask + appr_err * appr_condition.type_as(lower)
+            ix.c = ix.c * mask + appr_err.masked_fill(~appr_condition, 0.0)
 
-            for i in range(len(ix.edep)):
-                ix.edep[i] = ix.edep[i] * ix.edep_ind[i].mm(mask)
+            ix.edep = _scale_edep(ix.edep, ix.edep_ind, mask)
 
             ix.idep = ix.idep * mask.view(ix.batch_size, 1, ix.n)
             ix.idep_proj = ix.idep_proj * mask.view(ix.batch_size, ix.n)
@@ -648,13 +782,12 @@ class Interval_ReLU(nn.Module):
             upper = ix.u
             # print("sym u", upper)
             # print("sym l", lower)
-            appr_condition = ((lower < 0) * (upper > 0)).detach()
+            appr_condition = (lower < 0) & (upper > 0)
             mask = (lower > 0).type_as(lower)
-            m = int(appr_condition.sum().item())
             # appr_ind = appr_condition.view(-1,ix.n).nonzero()
 
             appr_err = upper / 2.0
-            appr_err = appr_err * (appr_condition.type_as(appr_err))
+            appr_err = appr_err.masked_fill(~appr_condition, 0.0)
 
             ix.edep = ix.edep * mask
             ix.edep = ix.edep + appr_err
@@ -667,28 +800,7 @@ class Interval_ReLU(nn.Module):
             return ix
 
         if isinstance(ix, Inverse_interval):
-            lower = ix.l
-            upper = ix.u
-
-            # print("naive", upper)
-
-            if ix.use_cuda:
-                appr_condition = (
-                    ((lower < 0) * (upper > 0))
-                    .type(torch.Tensor)
-                    .cuda(device=ix.c.get_device())
-                )
-            else:
-                appr_condition = ((lower < 0) * (upper > 0)).type(torch.Tensor)
-
-            mask = appr_condition * ((upper) / (upper - lower + 0.000001))
-            mask = mask + 1 - appr_condition
-            if ix.use_cuda:
-                mask = mask * (
-                    (upper > 0).type(torch.Tensor).cuda(device=ix.c.get_device())
-                )
-            else:
-                mask = mask * (upper > 0).type(torch.Tensor)
+            mask = _interval_relu_mask(ix.l, ix.u)
             ix.mask.append(mask)
             # print(ix.e.shape)
             ix.update_lu(F.relu(ix.l), F.relu(ix.u))
@@ -726,6 +838,28 @@ class Interval_Flatten(nn.Module):
             return ix
 
 
+# Interval wrappers of the torch layers, keyed by layer type. Each entry
+# is (wrapper class, takes_first_layer); only the affine layers consume
+# the first_layer flag.
+_INTERVAL_LAYERS = {
+    nn.Linear: (Interval_Dense, True),
+    nn.Conv2d: (Interval_Conv2d, True),
+    nn.ReLU: (Interval_ReLU, False),
+}
+
+
+def _interval_wrapper(layer):
+    """(wrapper class, takes first_layer) entry of `layer`, or None.
+    Exact types are found with the first lookup; subclasses fall back to
+    their base classes.
+    """
+    for cls in type(layer).__mro__:
+        entry = _INTERVAL_LAYERS.get(cls)
+        if entry is not None:
+            return entry
+    return None
+
+
 class Interval_Bound(nn.Module):
     def __init__(
         self,
@@ -736,6 +870,7 @@ class Interval_Bound(nn.Module):
         use_cuda=True,
         norm="linf",
         worst_case=True,
+        dtype=None,
     ):
         nn.Module.__init__(self)
         self.net = net
@@ -763,6 +898,18 @@ class Interval_Bound(nn.Module):
         # assert self.norm in ["linf", "l2", "l1"], "norm" + norm + "not supported"
 
         self.worst_case = worst_case
+        assert dtype is None or (method == "sym" and proj is None), (
+            "dtype is only supported by symbolic interval analysis without proj!"
+        )
+        self.dtype = dtype
+
+    def input_range(self, X, epsilon, minimum, maximum):
+        """Input ranges [X-epsilon, X+epsilon] clamped to [minimum, maximum].
+        The clamping is done in place to avoid one temporary per bound.
+        """
+        lower = (X - epsilon).clamp_(minimum, maximum)
+        upper = (X + epsilon).clamp_(minimum, maximum)
+        return lower, upper
 
     def forward(self, X, y):
 
@@ -776,7 +923,11 @@ class Interval_Bound(nn.Module):
             c = None
 
         # Transfer original model to interval models
-        inet = Interval_network(self.net, c)
+        inet = _inet_cache.get(self.net)
+        if inet is None or not inet.wraps(self.net):
+            inet = Interval_network(self.net)
+            _inet_cache[self.net] = inet
+        inet.set_wc_matrix(c)
 
         minimum = X.min().item()
         maximum = X.max().item()
@@ -784,28 +935,24 @@ class Interval_Bound(nn.Module):
         # Create symbolic inteval classes from X
         if self.method == "naive":
             ix = Interval(
-                torch.clamp(X - self.epsilon, minimum, maximum),
-                torch.clamp(X + self.epsilon, minimum, maximum),
+                *self.input_range(X, self.epsilon, minimum, maximum),
                 self.use_cuda,
             )
         if self.method == "inverse":
             ix = Inverse_interval(
-                torch.clamp(X - self.epsilon, minimum, maximum),
-                torch.clamp(X + self.epsilon, minimum, maximum),
+                *self.input_range(X, self.epsilon, minimum, maximum),
                 self.use_cuda,
             )
         if self.method == "center_sym":
             ix = Center_symbolic_interval(
-                torch.clamp(X - self.epsilon, minimum, maximum),
-                torch.clamp(X + self.epsilon, minimum, maximum),
+                *self.input_range(X, self.epsilon, minimum, maximum),
                 self.use_cuda,
             )
 
         if self.method == "gen":
             if self.norm[0] == "linf":
                 ix = gen_sym(
-                    torch.clamp(X - self.epsilon[0], minimum, maximum),
-                    torch.clamp(X + self.epsilon[0], minimum, maximum),
+                    *self.input_range(X, self.epsilon[0], minimum, maximum),
                     epsilon=self.epsilon,
                     norm=self.norm,
                     use_cuda=self.use_cuda,
@@ -816,8 +963,7 @@ class Interval_Bound(nn.Module):
         if self.method == "mix":
             assert self.norm == "linf", "only support linf for now"
             ix = mix_interval(
-                torch.clamp(X - self.epsilon, minimum, maximum),
-                torch.clamp(X + self.epsilon, minimum, maximum),
+                *self.input_range(X, self.epsilon, minimum, maximum),
                 use_cuda=self.use_cuda,
             )
 
@@ -833,21 +979,31 @@ class Interval_Bound(nn.Module):
             if self.proj is None:
                 if self.norm == "linf":
                     ix = Symbolic_interval(
-                        torch.clamp(X - self.epsilon, minimum, maximum),
-                        torch.clamp(X + self.epsilon, minimum, maximum),
+                        *self.input_range(X, self.epsilon, minimum, maximum),
                         use_cuda=self.use_cuda,
+                        dtype=self.dtype,
                     )
                 elif self.norm == "l2":
                     ix = Symbolic_interval(
-                        X, X, self.epsilon, norm="l2", use_cuda=self.use_cuda
+                        X,
+                        X,
+                        self.epsilon,
+                        norm="l2",
+                        use_cuda=self.use_cuda,
+                        dtype=self.dtype,
                     )
                 elif self.norm == "l1":
                     ix = Symbolic_interval(
-                        X, X, self.epsilon, norm="l1", use_cuda=self.use_cuda
+                        X,
+                        X,
+                        self.epsilon,
+                        norm="l1",
+                        use_cuda=self.use_cuda,
+                        dtype=self.dtype,
                     )
             else:
-                input_size = list(X[0].reshape(-1).size())[0]
-                batch_size = list(X.size())[0]
+                input_size = X[0].numel()
+                batch_size = X.size(0)
                 # symbolic_interval_proj1 uses symbolic linear relaxation
                 # proposed in Neurify paper. It provides tight approximation
                 # when dependency are mostly kept. However, if over a half
@@ -887,16 +1043,14 @@ class Interval_Bound(nn.Module):
 
                 if self.proj > (input_size / 2):
                     ix = Symbolic_interval_proj1(
-                        torch.clamp(X - self.epsilon, minimum, maximum),
-                        torch.clamp(X + self.epsilon, minimum, maximum),
+                        *self.input_range(X, self.epsilon, minimum, maximum),
                         self.proj,
                         grad_ind,
                         self.use_cuda,
                     )
                 else:
                     ix = Symbolic_interval_proj2(
-                        torch.clamp(X - self.epsilon, minimum, maximum),
-                        torch.clamp(X + self.epsilon, minimum, maximum),
+                        *self.input_range(X, self.epsilon, minimum, maximum),
                         self.proj,
                         grad_ind,
                         self.use_cuda,
@@ -913,10 +1067,15 @@ class Interval_Bound(nn.Module):
 
         # Calculate the worst case outputs
         if self.method != "naive":
-            wc = ix.worst_case(y, out_features)
-            return wc
+            out = ix.worst_case(y, out_features)
+        else:
+            out = -ix.l
 
-        return -ix.l
+        # The cached network outlives this call, so drop its per-call
+        # state instead of keeping it allocated until the next batch.
+        inet.intermediate_ix = []
+        inet.set_wc_matrix(None)
+        return out
 
 
 """Naive interval propagations.
@@ -1033,6 +1192,9 @@ Args:
 	Naive interval throws away all of the dependency (proj=0).
 	One can freely adjust tightness by controlling proj to be from
 	0 to input size. 
+	dtype: precision of the input dependencies, e.g. torch.bfloat16.
+	None keeps the precision of X. Lower precision is faster but
+	the bounds are not guaranteed to be sound.
 	
 
 Return:
@@ -1043,17 +1205,37 @@ Return:
 
 
 def sym_interval_analyze(
-    net, epsilon, X, y, use_cuda=True, parallel=False, proj=None, norm="linf"
+    net,
+    epsilon,
+    X,
+    y,
+    use_cuda=True,
+    parallel=False,
+    proj=None,
+    norm="linf",
+    dtype=None,
 ):
     if parallel:
         wc = nn.DataParallel(
             Interval_Bound(
-                net, epsilon, method="sym", proj=proj, use_cuda=use_cuda, norm=norm
+                net,
+                epsilon,
+                method="sym",
+                proj=proj,
+                use_cuda=use_cuda,
+                norm=norm,
+                dtype=dtype,
             )
         )(X, y)
     else:
         wc = Interval_Bound(
-            net, epsilon, method="sym", proj=proj, use_cuda=use_cuda, norm=norm
+            net,
+            epsilon,
+            method="sym",
+            proj=proj,
+            use_cuda=use_cuda,
+            norm=norm,
+            dtype=dtype,
         )(X, y)
     iloss = nn.CrossEntropyLoss()(wc, y)
     ierr = wc.max(1)[1] != y